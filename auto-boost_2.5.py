@@ -1,7 +1,7 @@
 #Originally by Trix
 #Contributors: R1chterScale, Yiss, Kosaka & others from AV1 Weeb edition
 
-from math import ceil, floor
+from math import floor
 from pathlib import Path
 from tqdm import tqdm
 import json
@@ -9,12 +9,15 @@ import os
 import subprocess
 import re
 import argparse
+import numpy as np
 import psutil
 import shutil
+import tempfile
 import platform
 import vapoursynth as vs
 core = vs.core
 core.max_cache_size = 1024
+core.num_threads = psutil.cpu_count(logical=True)
 
 IS_WINDOWS = platform.system() == 'Windows'
 NULL_DEVICE = 'NUL' if IS_WINDOWS else '/dev/null'
@@ -49,6 +52,8 @@ output_dir = src_file.parent
 tmp_dir = Path(args.temp).resolve() if args.temp is not None else output_dir / src_file.stem
 output_file = output_dir / f"{src_file.stem}_fastpass.mkv"
 scenes_file = tmp_dir / "scenes.json"
+ssimu2_log_path = output_dir / f"{src_file.stem}_ssimu2.log"
+xpsnr_log_path = output_dir / f"{src_file.stem}_xpsnr.log"
 br = float(args.deviation)
 skip = int(args.skip) if args.skip is not None else default_skip
 aggressive = args.aggressive
@@ -57,17 +62,24 @@ def get_ranges(scenes: str) -> list[int]:
     """
     Reads a scene file and returns a list of frame numbers for each scene change.
 
+    The parsed list is cached as a .npy file next to the scene file so repeat
+    stage invocations skip the JSON parse.
+
     :param scenes: path to scene file
     :type scenes: str
 
     :return: list of frame numbers
     :rtype: list[int]
     """
+    cache_file = scenes.with_name(f"{scenes.name}.ranges.npy")
+    if cache_file.exists() and cache_file.stat().st_mtime >= scenes.stat().st_mtime:
+        return np.load(cache_file).tolist()
     ranges = [0]
     with scenes.open("r") as file:
         content = json.load(file)
         for scene in content['scenes']:
             ranges.append(scene['end_frame'])
+    np.save(cache_file, np.asarray(ranges, dtype=np.int64))
     return ranges
 
 def fast_pass(
@@ -110,14 +122,14 @@ def fast_pass(
     ]
 
     try:
-        subprocess.run(fast_av1an_command, text=True, check=True)
+        subprocess.run(fast_av1an_command, check=True)
     except subprocess.CalledProcessError as e:
        print(f"Av1an encountered an error:\n{e}")
        exit(1)
 
 def turbo_metrics(
     source: str, distorted: str, every: int
-) -> subprocess.CompletedProcess:
+) -> subprocess.Popen:
     """
     Compare two files with SSIMULACRA2 using turbo-metrics.
 
@@ -128,8 +140,8 @@ def turbo_metrics(
     :param every: compare every X frames
     :type every: int
 
-    :return: completed process
-    :rtype: subprocess.CompletedProcess
+    :return: running process with piped stdout
+    :rtype: subprocess.Popen
     """
 
     turbo_cmd = [
@@ -147,71 +159,99 @@ def turbo_metrics(
     turbo_cmd.append(source)
     turbo_cmd.append(distorted)
 
-    return subprocess.run(
+    # spool stderr to an unlinked temp file instead of a pipe: we only read stdout
+    # while the child runs, and a full stderr pipe would block it mid-encode.
+    stderr_file = tempfile.TemporaryFile()
+    turbo_metrics_run = subprocess.Popen(
         turbo_cmd,
-        capture_output=True,
-        text=True,
+        stdout=subprocess.PIPE,
+        stderr=stderr_file,
     )
+    turbo_metrics_run.stderr = stderr_file
+    return turbo_metrics_run
 
 def calculate_ssimu2(src_file, enc_file, ssimu2_txt_path, ranges, skip):
     if not ssimu2zig:  # Try turbo-metrics first if ssimu2zig is False
         turbo_metrics_run = turbo_metrics(src_file, enc_file, skip)
-        if turbo_metrics_run.returncode == 0:  # If turbo-metrics succeeds
-            with ssimu2_txt_path.open("w") as file:
-                file.write(f"skip: {skip}\n")
+        with ssimu2_txt_path.open("wb") as file:
+            file.write(f"skip: {skip}\n".encode())
             frame = 0
+            buffer: list[bytes] = []
             # for whatever reason, turbo-metrics in csv mode dumps the entire scores to stdout at the end even though it prints them live to stdout.
-            # so we need to see if we've seen ``ssimulacra2`` before and if we have, ignore anything after the second one.
+            # the "ssimulacra2" csv header therefore shows up twice: once before the live scores and once before the dupe dump.
             ignore_end_barf = False
-            for line in turbo_metrics_run.stdout.splitlines():
-                # set ignore_end_barf to true as this is the first "ssimulacra2" line
-                if line == "ssimulacra2" and not ignore_end_barf:
+            for line in turbo_metrics_run.stdout:
+                line = line.rstrip(b"\r\n")
+                if line == b"ssimulacra2":
+                    # second header means the end dump is starting, stop before we log a dupe of the scores.
+                    if ignore_end_barf:
+                        break
                     ignore_end_barf = True
-                # break the loop as we've encountered the second "ssimulacra2" line so we don't get a dupe of the scores.
-                elif line == "ssimulacra2" and ignore_end_barf:
-                    break
-                # assume everything not "ssimulacra2" is a score.
-                if line != "ssimulacra2":
-                    frame += 1
-                    with ssimu2_txt_path.open("a") as file:
-                        file.write(f"{frame}: {float(line)}\n")
+                    continue
+                # scores only show up after the first header; anything printed before it is not a score
+                # (a failing run complains there) and gets settled by the returncode check below.
+                if not ignore_end_barf:
+                    continue
+                # the line already is a valid numeric string, log it as-is without a float round-trip
+                frame += 1
+                buffer.append(b"%d: %s\n" % (frame, line))
+                if len(buffer) >= 4096:
+                    file.writelines(buffer)
+                    buffer.clear()
+            file.writelines(buffer)
+        # drain whatever is left of the end dump so turbo-metrics never blocks on a full pipe
+        for line in turbo_metrics_run.stdout:
+            pass
+        if turbo_metrics_run.wait() == 0:  # If turbo-metrics succeeds
+            turbo_metrics_run.stderr.close()
             return  # Exit if turbo-metrics succeeded
         else:
             print(f"Turbo Metrics exited with code: {turbo_metrics_run.returncode}")
-            print(turbo_metrics_run.stdout)
-            print(turbo_metrics_run.stderr)
+            turbo_metrics_run.stderr.seek(0)
+            print(turbo_metrics_run.stderr.read().decode())
+            turbo_metrics_run.stderr.close()
             print("Falling back to vs-zip")
             skip = int(args.skip) if args.skip is not None else 3
 
     # If ssimu2zig is True or turbo-metrics failed, use vs-zip
-    is_vpy = os.path.splitext(os.path.basename(src_file))[1] == ".vpy"
+    is_vpy = src_file.suffix == ".vpy"
     vpy_vars = {}
     if is_vpy:
         exec(open(src_file).read(), globals(), vpy_vars)
     # in order for auto-boost to use a .vpy file as a source, the output clip should be a global variable named clip
-    source_clip = core.lsmas.LWLibavSource(source=src_file, cache=0) if not is_vpy else vpy_vars["clip"]
-    encoded_clip = core.lsmas.LWLibavSource(source=enc_file, cache=0)
+    # keep the .lwi index next to each file so re-runs skip the indexing pass entirely
+    source_clip = core.lsmas.LWLibavSource(source=src_file, cachefile=f"{src_file}.lwi") if not is_vpy else vpy_vars["clip"]
+    encoded_clip = core.lsmas.LWLibavSource(source=enc_file, cachefile=f"{enc_file}.lwi")
 
     #source_clip = source_clip.resize.Bicubic(format=vs.RGBS, matrix_in_s='709').fmtc.transfer(transs="srgb", transd="linear", bits=32)
     #encoded_clip = encoded_clip.resize.Bicubic(format=vs.RGBS, matrix_in_s='709').fmtc.transfer(transs="srgb", transd="linear", bits=32)
 
     print(f"source: {len(source_clip)} frames")
     print(f"encode: {len(encoded_clip)} frames")
+    # splice the per-scene selections into one clip so vszip.Metrics is instantiated
+    # once for the whole video and VapourSynth can prefetch across scene boundaries
+    cut_source_clips = []
+    cut_encoded_clips = []
+    for i in range(len(ranges) - 1):
+        cut_source_clips.append(source_clip[ranges[i]:ranges[i+1]].std.SelectEvery(cycle=skip, offsets=1))
+        cut_encoded_clips.append(encoded_clip[ranges[i]:ranges[i+1]].std.SelectEvery(cycle=skip, offsets=1))
+    result = core.vszip.Metrics(core.std.Splice(cut_source_clips), core.std.Splice(cut_encoded_clips), mode=0)
+
+    iter = 0
+    buffer: list[str] = []
     with ssimu2_txt_path.open("w") as file:
         file.write(f"skip: {skip}\n")
-    iter = 0
-    with tqdm(total=floor(len(source_clip) / int(skip)), desc=f'Calculating SSIMULACRA 2 scores') as pbar:
-        for i in range(len(ranges) - 1):
-            cut_source_clip = source_clip[ranges[i]:ranges[i+1]].std.SelectEvery(cycle=skip, offsets=1)
-            cut_encoded_clip = encoded_clip[ranges[i]:ranges[i+1]].std.SelectEvery(cycle=skip, offsets=1)
-            result = core.vszip.Metrics(cut_source_clip, cut_encoded_clip, mode=0)
-            for index, frame in enumerate(result.frames()):
+        with tqdm(total=floor(len(source_clip) / int(skip)), desc=f'Calculating SSIMULACRA 2 scores') as pbar:
+            for frame in result.frames(prefetch=core.num_threads):
                 iter += 1
                 score = frame.props['_SSIMULACRA2']
-                with ssimu2_txt_path.open("a") as file:
-                    file.write(f"{iter}: {score}\n")
+                buffer.append(f"{iter}: {score}\n")
                 pbar.update(skip)
-def calculate_xpsnr(src_file, enc_path, xpsnr_txt_path):
+                if len(buffer) >= 4096:
+                    file.writelines(buffer)
+                    buffer.clear()
+            file.writelines(buffer)
+def calculate_xpsnr(src_file, enc_path, xpsnr_txt_path) -> subprocess.Popen:
     if IS_WINDOWS:
         xpsnr_txt_path = f"{src_file.stem}_xpsnr.log"
         src_file_dir = src_file.parent
@@ -225,84 +265,66 @@ def calculate_xpsnr(src_file, enc_path, xpsnr_txt_path):
         "-f", "null", NULL_DEVICE
     ]
 
-    try:
-        subprocess.run(xpsnr_command, text=True, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"XPSNR encountered an error:\n{e}")
+    return subprocess.Popen(xpsnr_command, text=True)
+
+def wait_xpsnr(xpsnr_run: subprocess.Popen):
+    if xpsnr_run.wait() != 0:
+        print(f"XPSNR encountered an error, ffmpeg exited with code: {xpsnr_run.returncode}")
         exit(-2)
 
+XPSNR_PATTERN = re.compile(rb"XPSNR [yY]: ([0-9]+\.[0-9]+|inf)  XPSNR [uU]: ([0-9]+\.[0-9]+|inf)  XPSNR [vV]: ([0-9]+\.[0-9]+|inf)")
+
 def get_xpsnr(xpsnr_txt_path):
-    count=0
-
-    sum_weighted = 0
-    values_weighted: list[int] = []
-
-    with xpsnr_txt_path.open("r") as file:
-        for line in file:
-            match = re.search(r"XPSNR [yY]: ([0-9]+\.[0-9]+|inf)  XPSNR [uU]: ([0-9]+\.[0-9]+|inf)  XPSNR [vV]: ([0-9]+\.[0-9]+|inf)", line)
-            if match:
-                Y = float(match.group(1)) if match.group(1) != 'inf' else 100.0
-                U = float(match.group(2)) if match.group(2) != 'inf' else 100.0
-                V = float(match.group(3)) if match.group(3) != 'inf' else 100.0
-                W = (4 * Y + U + V) / 6
-
-                sum_weighted += W
-                values_weighted.append(W)
-
-                count += 1
-            else:
-                print(line)
-        avg_weighted = sum_weighted / count
-        for i in range(len(values_weighted)):
-            values_weighted[i] /= avg_weighted
+    matches = XPSNR_PATTERN.findall(xpsnr_txt_path.read_bytes())
+    if not matches:
+        print("No XPSNR scores detected in XPSNR file, exiting.")
+        exit(-2)
+    scores = np.asarray(matches, dtype=np.float32)
+    scores[np.isinf(scores)] = 100.0
+    # contract the (4Y+U+V)/6 weighting in one pass instead of materializing per-plane arrays
+    values_weighted = np.einsum('ij,j->i', scores, np.array([4.0/6.0, 1.0/6.0, 1.0/6.0], dtype=np.float32))
+    values_weighted *= 1.0 / values_weighted.mean()
     return values_weighted
 
 def get_ssimu2(ssimu2_txt_path):
-    ssimu2_scores: list[int] = []
-
-    with ssimu2_txt_path.open("r") as file:
-        skipmatch = re.search(r"skip: ([0-9]+)", file.readline())
+    with ssimu2_txt_path.open("rb") as file:
+        skipmatch = re.search(rb"skip: ([0-9]+)", file.readline())
         if skipmatch:
             skip = int(skipmatch.group(1))
         else:
             print("Skip value not detected in SSIMU2 file, exiting.")
             exit(-2)
-        for line in file:
-            match = re.search(r"([0-9]+): ([0-9]+\.[0-9]+)", line)
-            if match:
-                score = float(match.group(2))
-                ssimu2_scores.append(score)
-            else:
-                print(line)
+        # remaining lines are all "frame: score", let loadtxt split them in one pass
+        ssimu2_scores = np.loadtxt(file, delimiter=":", usecols=1, dtype=np.float32, ndmin=1)
     return ssimu2_scores, skip
 
-def calculate_std_dev(score_list: list[int]):
+def calculate_std_dev(score_list):
     """
-    Takes a list of metrics scores and returns the associated arithmetic mean,
-    5th percentile and 95th percentile scores.
+    Takes a list or ndarray of metrics scores and returns the associated
+    arithmetic mean, 5th percentile and 95th percentile scores.
 
     :param score_list: list of SSIMU2 scores
     :type score_list: list
     """
 
-    filtered_score_list = [score if score >= 0 else 0.0 for score in score_list]
-    sorted_score_list = sorted(filtered_score_list)
-    average = sum(filtered_score_list)/len(filtered_score_list)
-    percentile_5 = sorted_score_list[len(filtered_score_list)//20]
-    percentile_95 = sorted_score_list[int (len(filtered_score_list)//(20/19))]
+    filtered_scores = np.maximum(np.asarray(score_list, dtype=np.float32), 0.0)
+    percentile_5_index = filtered_scores.size//20
+    percentile_95_index = int(filtered_scores.size//(20/19))
+    partitioned_scores = np.partition(filtered_scores, [percentile_5_index, percentile_95_index])
+    average = float(filtered_scores.mean())
+    percentile_5 = float(partitioned_scores[percentile_5_index])
+    percentile_95 = float(partitioned_scores[percentile_95_index])
     return (average, percentile_5, percentile_95)
 
 def generate_zones(ranges: list, percentile_5_total: list, average: int, crf: float, zones_txt_path: str):
     """
-    Appends a scene change to the ``zones_txt_path`` file in Av1an zones format.
-
-    creates ``zones_txt_path`` if it does not exist. If it does exist, the line is
-    appended to the end of the file.
+    Writes one line per scene change to the ``zones_txt_path`` file in Av1an
+    zones format, replacing the file if it already exists.
 
     :param ranges: Scene changes list
     :type ranges: list
-    :param percentile_5_total: List containing all 5th percentile scores
-    :type percentile_5_total: list
+    :param percentile_5_total: Array containing all 5th percentile scores
+    :type percentile_5_total: np.ndarray
     :param average: Full clip average score
     :type average: int
     :param crf: CRF setting to use for the zone
@@ -310,63 +332,45 @@ def generate_zones(ranges: list, percentile_5_total: list, average: int, crf: fl
     :param zones_txt_path: Path to the zones.txt file
     :type zones_txt_path: str
     """
-    zones_iter = 0
-    for i in range(len(ranges)-1):
-        zones_iter += 1
-        if aggressive:
-            new_crf = crf - ceil((1.0 - (percentile_5_total[i] / average)) * 40 * 4) / 4
-        else:
-            new_crf = crf - ceil((1.0 - (percentile_5_total[i] / average)) * 20 * 4) / 4
-
-        if new_crf < crf - br: # set lowest allowed crf
-            new_crf = crf - br
-
-        if new_crf > crf + br: # set highest allowed crf
-            new_crf = crf + br
+    boost_factor = 40 * 4 if aggressive else 20 * 4
+    percentile_5_total = np.asarray(percentile_5_total, dtype=np.float64)
+    # clamp to [crf - br, crf + br] so the deviation limit still applies
+    new_crfs = np.clip(crf - np.ceil((1.0 - percentile_5_total / average) * boost_factor) / 4, crf - br, crf + br)
 
-        print(f'Enc:  [{ranges[i]}:{ranges[i+1]}]\n'
-              f'Chunk 5th percentile: {percentile_5_total[i]}\n'
-              f'Adjusted CRF: {new_crf:.2f}\n')
+    with zones_txt_path.open("w") as file:
+        for i in range(len(ranges)-1):
+            print(f'Enc:  [{ranges[i]}:{ranges[i+1]}]\n'
+                  f'Chunk 5th percentile: {percentile_5_total[i]}\n'
+                  f'Adjusted CRF: {new_crfs[i]:.2f}\n')
 
-        with zones_txt_path.open("w" if zones_iter == 1 else "a") as file:
-            file.write(f"{ranges[i]} {ranges[i+1]} svt-av1 --crf {new_crf:.2f}\n")
+            file.write(f"{ranges[i]} {ranges[i+1]} svt-av1 --crf {new_crfs[i]:.2f}\n")
 
 def calculate_metrics(src_file, output_file, tmp_dir, ranges, skip, metrics):
     match metrics:
         case 1:
-            ssimu2_txt_path = output_dir / f"{src_file.stem}_ssimu2.log"
-            calculate_ssimu2(src_file, output_file, ssimu2_txt_path, ranges, skip)
+            calculate_ssimu2(src_file, output_file, ssimu2_log_path, ranges, skip)
         case 2:
-            xpsnr_txt_path = output_dir / f"{src_file.stem}_xpsnr.log"
-            calculate_xpsnr(src_file, output_file, xpsnr_txt_path)
+            wait_xpsnr(calculate_xpsnr(src_file, output_file, xpsnr_log_path))
         case 3:
-            xpsnr_txt_path = output_dir / f"{src_file.stem}_xpsnr.log"
-            ssimu2_txt_path = output_dir / f"{src_file.stem}_ssimu2.log"
-            calculate_xpsnr(src_file, output_file, xpsnr_txt_path)
-            calculate_ssimu2(src_file, output_file, ssimu2_txt_path, ranges, skip)
+            # both metrics only read the two files, so let ffmpeg crunch XPSNR while SSIMU2 runs here
+            xpsnr_run = calculate_xpsnr(src_file, output_file, xpsnr_log_path)
+            calculate_ssimu2(src_file, output_file, ssimu2_log_path, ranges, skip)
+            wait_xpsnr(xpsnr_run)
 
 def calculate_zones(tmp_dir, ranges, zones, cq):
     match zones:
         case 1:
-            ssimu2_txt_path = output_dir / f"{src_file.stem}_ssimu2.log"
-            (ssimu2_scores, skip) = get_ssimu2(ssimu2_txt_path)
+            (ssimu2_scores, skip) = get_ssimu2(ssimu2_log_path)
             ssimu2_zones_txt_path = tmp_dir / "ssimu2_zones.txt"
-            ssimu2_total_scores: list[int] = []
-            ssimu2_percentile_5_total = []
-            ssimu2_iter = 0
-
-            for i in range(len(ranges)-1):
-                ssimu2_chunk_scores: list[int] = []
-                xpsnr_chunk_scores: list[int] = []
-                ssimu2_frames = (ranges[i+1] - ranges[i]) // skip
-                for frames in range(ssimu2_frames):
-                    ssimu2_score = ssimu2_scores[ssimu2_iter]
-                    ssimu2_chunk_scores.append(ssimu2_score)
-                    ssimu2_total_scores.append(ssimu2_score)
-                    ssimu2_iter += 1
-                (ssimu2_average, ssimu2_percentile_5, ssimu2_percentile_95) = calculate_std_dev(ssimu2_chunk_scores)
-                ssimu2_percentile_5_total.append(ssimu2_percentile_5)
-                #print(f'5th Percentile:  {ssimu2_percentile_5}')
+
+            ranges_arr = np.asarray(ranges, dtype=np.int64)
+            chunk_lengths = (ranges_arr[1:] - ranges_arr[:-1]) // skip
+            chunk_ends = np.cumsum(chunk_lengths)
+            chunk_starts = chunk_ends - chunk_lengths
+            ssimu2_total_scores = np.maximum(ssimu2_scores[:chunk_ends[-1]], 0.0)
+            ssimu2_percentile_5_total = np.empty(chunk_lengths.size, dtype=np.float32)
+            for i, (start, end) in enumerate(zip(chunk_starts, chunk_ends)):
+                ssimu2_percentile_5_total[i] = np.partition(ssimu2_total_scores[start:end], (end - start)//20)[(end - start)//20]
             (ssimu2_average, ssimu2_percentile_5, ssimu2_percentile_95) = calculate_std_dev(ssimu2_total_scores)
 
             print(f'SSIMU2:')
@@ -376,23 +380,17 @@ def calculate_zones(tmp_dir, ranges, zones, cq):
             generate_zones(ranges, ssimu2_percentile_5_total, ssimu2_average, cq, ssimu2_zones_txt_path)
 
         case 2:
-            xpsnr_txt_path = output_dir / f"{src_file.stem}_xpsnr.log"
-            xpsnr_scores: list[int] = get_xpsnr(xpsnr_txt_path)
+            xpsnr_scores = get_xpsnr(xpsnr_log_path)
             xpsnr_zones_txt_path = tmp_dir / "xpsnr_zones.txt"
-            xpsnr_total_scores: list[int] = []
-            xpsnr_percentile_5_total = []
-            xpsnr_iter = 0
-
-            for i in range(len(ranges)-1):
-                xpsnr_chunk_scores: list[int] = []
-                xpsnr_frames = (ranges[i+1] - ranges[i])
-                for frames in range(xpsnr_frames):
-                    xpsnr_score = xpsnr_scores[xpsnr_iter]
-                    xpsnr_chunk_scores.append(xpsnr_score)
-                    xpsnr_total_scores.append(xpsnr_score)
-                    xpsnr_iter += 1
-                (xpsnr_average, xpsnr_percentile_5, xpsnr_percentile_95) = calculate_std_dev(xpsnr_chunk_scores)
-                xpsnr_percentile_5_total.append(xpsnr_percentile_5)
+
+            ranges_arr = np.asarray(ranges, dtype=np.int64)
+            chunk_lengths = ranges_arr[1:] - ranges_arr[:-1]
+            chunk_ends = np.cumsum(chunk_lengths)
+            chunk_starts = chunk_ends - chunk_lengths
+            xpsnr_total_scores = np.maximum(xpsnr_scores[:chunk_ends[-1]], 0.0)
+            xpsnr_percentile_5_total = np.empty(chunk_lengths.size, dtype=np.float32)
+            for i, (start, end) in enumerate(zip(chunk_starts, chunk_ends)):
+                xpsnr_percentile_5_total[i] = np.partition(xpsnr_total_scores[start:end], (end - start)//20)[(end - start)//20]
             (xpsnr_average, xpsnr_percentile_5, xpsnr_percentile_95) = calculate_std_dev(xpsnr_total_scores)
 
             print(f'XPSNR:')
@@ -402,31 +400,25 @@ def calculate_zones(tmp_dir, ranges, zones, cq):
             generate_zones(ranges, xpsnr_percentile_5_total, xpsnr_average, cq, xpsnr_zones_txt_path)
 
         case 3:
-            ssimu2_txt_path = output_dir / f"{src_file.stem}_ssimu2.log"
-            (ssimu2_scores, skip) = get_ssimu2(ssimu2_txt_path)
-            xpsnr_txt_path = output_dir / f"{src_file.stem}_xpsnr.log"
-            xpsnr_scores: list[int] = get_xpsnr(xpsnr_txt_path)
+            (ssimu2_scores, skip) = get_ssimu2(ssimu2_log_path)
+            xpsnr_scores = get_xpsnr(xpsnr_log_path)
 
             multiplied_zones_txt_path = tmp_dir / "multiplied_zones.txt"
-            multiplied_total_scores: list[int] = []
-            multiplied_percentile_5_total = []
-            multiplied_iter = 0
-            for i in range(len(ranges)-1):
-                multiplied_chunk_scores: list[int] = []
-                ssimu2_frames = (ranges[i+1] - ranges[i]) // skip
-                for frames in range(ssimu2_frames):
-                    ssimu2_score = ssimu2_scores[multiplied_iter]
-                    xpsnr_index = (skip*frames) + ranges[i] + 1
-                    xpsnr_scores_averaged = 0
-                    for avg_index in range(skip):
-                        xpsnr_scores_averaged += xpsnr_scores[xpsnr_index + avg_index - 1]
-                    xpsnr_scores_averaged /= skip
-                    multiplied_score = xpsnr_scores_averaged * ssimu2_score
-                    multiplied_chunk_scores.append(multiplied_score)
-                    multiplied_total_scores.append(multiplied_score)
-                    multiplied_iter += 1
-                (multiplied_average, multiplied_percentile_5, multiplied_percentile_95) = calculate_std_dev(multiplied_chunk_scores)
-                multiplied_percentile_5_total.append(multiplied_percentile_5)
+
+            ranges_arr = np.asarray(ranges, dtype=np.int64)
+            chunk_lengths = (ranges_arr[1:] - ranges_arr[:-1]) // skip
+            chunk_ends = np.cumsum(chunk_lengths)
+            chunk_starts = chunk_ends - chunk_lengths
+            # mean of every skip-sized window of XPSNR scores, indexed by the window's first frame
+            xpsnr_avg = np.convolve(xpsnr_scores, np.ones(skip, dtype=np.float32) / skip, mode='valid')
+            frame_offsets = np.arange(chunk_ends[-1], dtype=np.int64) - np.repeat(chunk_starts, chunk_lengths)
+            xpsnr_indices = np.repeat(ranges_arr[:-1], chunk_lengths) + skip * frame_offsets
+            multiplied_total_scores = xpsnr_avg[xpsnr_indices]
+            multiplied_total_scores *= ssimu2_scores[:chunk_ends[-1]]
+            np.maximum(multiplied_total_scores, 0.0, out=multiplied_total_scores)
+            multiplied_percentile_5_total = np.empty(chunk_lengths.size, dtype=np.float32)
+            for i, (start, end) in enumerate(zip(chunk_starts, chunk_ends)):
+                multiplied_percentile_5_total[i] = np.partition(multiplied_total_scores[start:end], (end - start)//20)[(end - start)//20]
             (multiplied_average, multiplied_percentile_5, multiplied_percentile_95) = calculate_std_dev(multiplied_total_scores)
 
             print(f'Multiplied:')
@@ -437,37 +429,28 @@ def calculate_zones(tmp_dir, ranges, zones, cq):
 
 
         case 4:
-            ssimu2_txt_path = output_dir / f"{src_file.stem}_ssimu2.log"
-            (ssimu2_scores, skip) = get_ssimu2(ssimu2_txt_path)
-            xpsnr_txt_path = output_dir / f"{src_file.stem}_xpsnr.log"
-            xpsnr_scores: list[int] = get_xpsnr(xpsnr_txt_path)
+            (ssimu2_scores, skip) = get_ssimu2(ssimu2_log_path)
+            xpsnr_scores = get_xpsnr(xpsnr_log_path)
 
             minimum_zones_txt_path = tmp_dir / "minimum_zones.txt"
-            minimum_total_scores: list[int] = []
-            minimum_percentile_5_total = []
-            minimum_iter = 0
-            ssimu2_total_scores: list[int] = []
-            for ssimu2_iter in range(len(ssimu2_scores)-1):
-                ssimu2_total_scores.append(ssimu2_scores[ssimu2_iter])
-            (ssimu2_average, ssimu2_percentile_5, ssimu2_percentile_95) = calculate_std_dev(ssimu2_total_scores)
 
-            for i in range(len(ranges)-1):
-                minimum_chunk_scores: list[int] = []
-                ssimu2_frames = (ranges[i+1] - ranges[i]) // skip
-                for frames in range(ssimu2_frames):
-                    ssimu2_score = ssimu2_scores[minimum_iter]
-                    xpsnr_index = (skip*frames) + ranges[i] + 1
-                    xpsnr_scores_averaged = 0
-                    for avg_index in range(skip):
-                        xpsnr_scores_averaged += xpsnr_scores[xpsnr_index + avg_index - 1]
-                    xpsnr_scores_averaged /= skip
-                    xpsnr_scores_averaged *= ssimu2_average
-                    minimum_score = min(ssimu2_score, xpsnr_scores_averaged)
-                    minimum_chunk_scores.append(minimum_score)
-                    minimum_total_scores.append(minimum_score)
-                    minimum_iter += 1
-                (minimum_average, minimum_percentile_5, minimum_percentile_95) = calculate_std_dev(minimum_chunk_scores)
-                minimum_percentile_5_total.append(minimum_percentile_5)
+            ranges_arr = np.asarray(ranges, dtype=np.int64)
+            chunk_lengths = (ranges_arr[1:] - ranges_arr[:-1]) // skip
+            chunk_ends = np.cumsum(chunk_lengths)
+            chunk_starts = chunk_ends - chunk_lengths
+            (ssimu2_average, ssimu2_percentile_5, ssimu2_percentile_95) = calculate_std_dev(ssimu2_scores[:-1])
+
+            # mean of every skip-sized window of XPSNR scores, indexed by the window's first frame
+            xpsnr_avg = np.convolve(xpsnr_scores, np.ones(skip, dtype=np.float32) / skip, mode='valid')
+            frame_offsets = np.arange(chunk_ends[-1], dtype=np.int64) - np.repeat(chunk_starts, chunk_lengths)
+            xpsnr_indices = np.repeat(ranges_arr[:-1], chunk_lengths) + skip * frame_offsets
+            minimum_total_scores = xpsnr_avg[xpsnr_indices]
+            minimum_total_scores *= ssimu2_average
+            np.minimum(ssimu2_scores[:chunk_ends[-1]], minimum_total_scores, out=minimum_total_scores)
+            np.maximum(minimum_total_scores, 0.0, out=minimum_total_scores)
+            minimum_percentile_5_total = np.empty(chunk_lengths.size, dtype=np.float32)
+            for i, (start, end) in enumerate(zip(chunk_starts, chunk_ends)):
+                minimum_percentile_5_total[i] = np.partition(minimum_total_scores[start:end], (end - start)//20)[(end - start)//20]
             (minimum_average, minimum_percentile_5, minimum_percentile_95) = calculate_std_dev(minimum_total_scores)
 
             print(f'Minimum:')